@@ -2,10 +2,13 @@ import os
 import re
 import shutil
 import logging
+from collections import defaultdict
 from logger import log_json
 from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Mapping
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional
 
 import pandas as pd
 import parmed as pmd
@@ -14,6 +17,24 @@ from numpy.typing import ArrayLike
 from database import Database
 from ssh_connection import SSHConnection
 
+_PATHLIKE_RE = re.compile(r"^((\/\w+\/)|(\.{1,2}\/)+|\w+\/)")
+# "{ name" opens a section, a line starting with "}" or the next "{" closes it
+_SECTION_RE = re.compile(
+    r"^[ \t]*\{\S*[ \t]+(\S+)[^\n]*$(.*?)(?:^[ \t]*\}|(?=^[ \t]*\{)|\Z)",
+    re.M | re.S,
+)
+# "key = value ; comment", lines starting with ";" are skipped
+_OPTION_RE = re.compile(r"^[ \t]*([^;\s]\S*)[ \t]+\S+[ \t]+(\S+)", re.M)
+
+
+@lru_cache(maxsize=32)
+def _parse_config_cached(
+    file: str, mtime_ns: int, section: Optional[str] = None
+) -> Mapping[str, Any]:
+    # mtime_ns is part of the key so an edited config is parsed again
+    return MappingProxyType(ContextMD._parse_config(Path(file), section))
+
+
 # DatabaseType = Type[Database]
 # StructureType = Type[pmd.Structure]
 
@@ -53,6 +74,7 @@ class ContextMD:
     PID: int = field(init=False)
 
     STEPS_HISTORY: List[str] = field(init=False, default_factory=list)
+    RUN_COMMANDS: List[str] = field(init=False, default_factory=list)
     TOPOLOGIES: Dict[str, pmd.Structure] = field(
         init=False, default_factory=dict)
     POSITIONS: pmd.unit.Quantity = field(
@@ -62,6 +84,13 @@ class ContextMD:
     TOP_EXT = {"gromas": ".top", "amber": ".parm7"}
     POS_EXT = {"gromas": ".gro", "amber": ".rst7"}
 
+    # cached properties and the attributes they are computed from
+    CACHED_DEPENDENCIES = {
+        "ENRG_GROUPS": ("TOPOLOGIES",),
+        "STRUCTURE": ("TOPOLOGIES", "POSITIONS", "BOX"),
+        "SLURM_CONFIG": ("TITLE_SOFTWARE", "TITLE_PROJECT_NAME"),
+    }
+
     def __post_init__(self) -> None:
         self.logger = logging.getLogger(__name__)
         self.logger.info("Initializing ContextMD")
@@ -74,6 +103,35 @@ class ContextMD:
         )
         self._init_dirs()
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+
+        # index SLURM_*, RUNMDn_* and TOPOLn_* options by their section
+        head, sep, tail = name.partition("_")
+        if sep and (
+            head == "SLURM"
+            or (head.startswith(("RUNMD", "TOPOL")) and head[5:].isdigit())
+        ):
+            if "_grouped" not in self.__dict__:
+                self.__dict__["_grouped"] = defaultdict(dict)
+            self._grouped[head][tail.lower()] = value
+
+        # remember which attributes hold paths for move_files
+        if isinstance(value, Path):
+            self.__dict__.setdefault("_path_attrs", set()).add(name)
+        elif name in self.__dict__.get("_path_attrs", ()):
+            self._path_attrs.discard(name)
+
+        for cached, dependencies in self.CACHED_DEPENDENCIES.items():
+            if name in dependencies or (
+                cached == "SLURM_CONFIG" and name.startswith("SLURM_")
+            ):
+                self.clear_cache(cached)
+
+    def clear_cache(self, *names: str) -> None:
+        for name in names:
+            self.__dict__.pop(name, None)
+
     def _init_dirs(self):
         self.logger.info("Initializing directories")
         for dir_attr in ["ROOT", "DATA_DIR", "PARAM_DIR"]:
@@ -112,7 +170,7 @@ class ContextMD:
 
         logger.info(f"Setting up context from file {str(file)}")
 
-        config_data = cls._parse_config(file)
+        config_data = _parse_config_cached(str(file), file.stat().st_mtime_ns)
         required_args: Dict[str, Any] = {}
         optional_args: Dict[str, Any] = {}
 
@@ -132,47 +190,42 @@ class ContextMD:
         data_cls = cls(**required_args)
 
         for key, value in optional_args.items():
-            data_cls.__dict__[key] = value
+            setattr(data_cls, key, value)
 
         return data_cls
 
     @staticmethod
-    def _parse_config(file: Path) -> Dict[str, Any]:
-        with open(file, "r") as config_file:
-            lines = config_file.readlines()
+    def read_section(file: Path, section: str) -> Mapping[str, Any]:
+        # parses only the requested section, from_config still reads everything
+        return _parse_config_cached(
+            str(file), file.stat().st_mtime_ns, section.upper()
+        )
+
+    @staticmethod
+    def _parse_config(file: Path, only: Optional[str] = None) -> Dict[str, Any]:
         config_data: Dict[str, Any] = {}
 
-        in_bracket = False
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            if line.startswith("{"):
-                in_bracket = True
-                section = line.split()[1]
+        text = Path(file).read_text()
+        for section in _SECTION_RE.finditer(text):
+            prefix = section.group(1).upper()
+            if only is not None and prefix != only:
                 continue
-            if line.startswith("}"):
-                in_bracket = False
-
-            if in_bracket:
-                key: str
-                value: str
-                if line.startswith(";"):
-                    continue
-                key, _, value, *comments = list(map(str.strip, line.split()))
-                config_data[f"{section.upper()}_{key.upper()}"] = value
+            for option in _OPTION_RE.finditer(section.group(2)):
+                key, value = option.groups()
+                config_data[f"{prefix}_{key.upper()}"] = value
+            if only is not None:
+                break
 
         return config_data
 
-    @property
+    @cached_property
     def ENRG_GROUPS(self) -> List[str]:
         enrg_groups: List[str] = []
-        for _, structure in self.TOPOLOGIES.items():
-            resnames = [residue.name for residue in structure.residues]
-            enrg_groups.extend(set(resnames))
+        for structure in self.TOPOLOGIES.values():
+            enrg_groups.extend({residue.name for residue in structure.residues})
         return enrg_groups
 
-    @property
+    @cached_property
     def STRUCTURE(self) -> pmd.Structure:
         if not self.POSITIONS or self.BOX is None:
             return None
@@ -184,13 +237,9 @@ class ContextMD:
         structure.box = self.BOX
         return structure
 
-    @property
+    @cached_property
     def SLURM_CONFIG(self) -> Dict[str, Any]:
-        slurm_config: Dict[str, Any] = {}
-        for key, value in self.__dict__.items():
-            if "SLURM" in key:
-                new_key = key.replace("SLURM_", "").lower()
-                slurm_config[new_key] = value
+        slurm_config: Dict[str, Any] = dict(self._grouped["SLURM"])
         slurm_config["software"] = self.TITLE_SOFTWARE
         slurm_config["job_name"] = self.TITLE_PROJECT_NAME
         return slurm_config
@@ -199,14 +248,11 @@ class ContextMD:
     def RUNMD_CONFIG(self) -> List[Dict[str, Any]]:
         config_list: List[Dict[str, Any]] = []
 
-        prefixes: List[str] = []
-        for attribute in list(self.__dict__.keys()):
-            match = re.search(r"^RUNMD\d+", attribute)
-            if match:
-                prefixes.append(match.group())
+        groups = self._grouped
+        prefixes = [prefix for prefix in groups if prefix.startswith("RUNMD")]
 
-        for prefix in self._sort_strings(set(prefixes)):
-            single_runmd = self._set_single_config(prefix)
+        for prefix in self._sort_strings(prefixes):
+            single_runmd = dict(groups[prefix])
 
             single_runmd["software"] = self.TITLE_SOFTWARE
             single_runmd["number"] = 0
@@ -222,26 +268,17 @@ class ContextMD:
 
     @property
     def TOP_CONFIG(self) -> List[Dict[str, Any]]:
-        config_list: List[Dict[str, Any]] = []
-
-        prefixes: List[str] = []
-        for attribute in list(self.__dict__.keys()):
-            if re.search(r"^TOPOL\d+_", attribute):
-                prefixes.append(attribute.split("_")[0])
+        groups = self._grouped
+        prefixes = [prefix for prefix in groups if prefix.startswith("TOPOL")]
 
-        for prefix in self._sort_strings(set(prefixes)):
-            single_top = self._set_single_config(prefix)
-
-            config_list.append(single_top)
-
-        return config_list
+        return [dict(groups[prefix]) for prefix in self._sort_strings(prefixes)]
 
     @staticmethod
     def _sort_strings(str_list: Iterable[str]) -> Iterable[str]:
         def match_digits(string: str) -> int:
-            match = re.search(r"\d+$", string)
-            if match:
-                return int(match.group())
+            digits = string[len(string.rstrip("0123456789")):]
+            if digits:
+                return int(digits)
             else:
                 return -1
 
@@ -249,8 +286,10 @@ class ContextMD:
 
     @staticmethod
     def _is_pathlike(string: str) -> bool:
-        regex = r"^((\/\w+\/)|(\.{1,2}\/)+|\w+\/)"
-        if re.search(regex, string):
+        # every alternative of the pattern needs a slash
+        if "/" not in string:
+            return False
+        if _PATHLIKE_RE.search(string):
             return True
         return False
 
@@ -270,16 +309,6 @@ class ContextMD:
             pos_filename = f"{prev_number}-{prev_sim_type}.{ext}"
         return pos_filename
 
-    def _set_single_config(self, prefix: str) -> Dict[str, Any]:
-        single_config: Dict[str, Any] = {}
-        kword_match = f"{prefix}_"
-        for key, value in list(self.__dict__.items()):
-            if kword_match in key:
-                new_key = key.replace(kword_match, "").lower()
-                single_config[new_key] = value
-
-        return single_config
-
     def add_entry(self, index: int, simulation_name: str) -> None:
         new_line_dict: Dict[str, Any] = {
             "ROOT DIR": self.PATHS_ROOT,
@@ -306,42 +335,53 @@ class ContextMD:
 
     def change_pid(self, pid: int):
         self.PID = pid
-        self.DATABASE.tmp_database["PID"] = pid
+        self.DATABASE.modify_pending("PID", pid)
 
     def find_index(self, simulation_name) -> int:
-        sim_kwargs = {
-            "PROJECT NAME": self.TITLE_PROJECT_NAME,
-            "SIMULATION NAME": simulation_name,
-        }
-        found_run = self.DATABASE.find_entries(**sim_kwargs)
+        found_run = self.DATABASE.find_key(self.TITLE_PROJECT_NAME, simulation_name)
 
-        if found_run.empty:
-            return len(self.DATABASE.database) + len(self.DATABASE.tmp_database)
+        if not found_run:
+            return len(self.DATABASE.database) + len(self.DATABASE.tmp_rows)
         elif len(found_run) > 1:
             raise Exception
         else:
-            return found_run.index[0]
+            return found_run[0]
 
     def move_files(self) -> None:
         self.logger.info("Moving files to data directory")
-        for key, src_path in self.__dict__.items():
-            if not isinstance(src_path, Path):
-                continue
-            if not src_path.exists() or src_path.is_dir():
+        path_attrs = [(key, getattr(self, key)) for key in self._path_attrs]
+
+        # one directory listing per parent instead of stat calls per file
+        listings: Dict[Path, Dict[str, os.DirEntry]] = {}
+        for key, src_path in path_attrs:
+            parent = src_path.parent
+            if parent not in listings:
+                try:
+                    with os.scandir(parent) as entries:
+                        listings[parent] = {entry.name: entry for entry in entries}
+                except OSError:
+                    listings[parent] = {}
+            entry = listings[parent].get(src_path.name)
+            if entry is None or not entry.is_file():
                 continue
+
             dest_path = self.PATHS_DATA_DIR / src_path.name
-            if dest_path.exists():
-                self.logger.debug(
-                    f"Removing existing file at destination: {str(dest_path)}"
-                )
-                os.remove(dest_path)
+            if dest_path.is_symlink():
+                # never write through a link, replace it with a real copy
+                dest_path.unlink()
+            elif dest_path.exists():
+                if os.path.samefile(src_path, dest_path):
+                    # src is the staged file itself, or a link or hard link to it
+                    setattr(self, key, dest_path)
+                    continue
+                dest_path.unlink()
 
             self.logger.debug(
                 f"Copying file from {str(src_path)} to {str(dest_path)}")
-            shutil.copy(src_path, dest_path)
+            shutil.copyfile(src_path, dest_path)
 
             self.logger.debug(f"Updating attribute {key} to {str(dest_path)}")
-            self.__dict__[key] = dest_path
+            setattr(self, key, dest_path)
         self.logger.info("File moving completed.")
 
     def remove_file(self, file_name: str):
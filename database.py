@@ -1,14 +1,30 @@
 import numpy as np
 import pandas as pd
 import os
-from typing import Dict, Any, List, Mapping
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Any, List, Mapping, Tuple
+
+
+@lru_cache(maxsize=8)
+def _load_database(database_path: str, size: int, mtime_ns: int) -> pd.DataFrame:
+    # size and mtime_ns only key the cache, a saved table is loaded again
+    return pd.read_pickle(database_path)
 
 
 class Database:
+    key_columns = ("PROJECT NAME", "SIMULATION NAME")
+
     def __init__(self, database_path: os.PathLike) -> None:
         self.database_path = database_path
-        self.database = pd.read_pickle(self.database_path)
-        self.tmp_database = pd.DataFrame(columns=self.database.columns)
+        stat = os.stat(self.database_path)
+        # callers modify the table in place, keep the cached one intact
+        self.database = _load_database(
+            str(self.database_path), stat.st_size, stat.st_mtime_ns
+        ).copy()
+        self.tmp_rows: Dict[Any, Dict[str, Any]] = {}
+        self.dirty = False
+        self.key_index = self._init_key_index()
 
     @classmethod
     def from_scratch(cls, database_path: os.PathLike, columns: List[str]) -> "Database":
@@ -16,25 +32,58 @@ class Database:
         return cls(database_path)
 
     def add_entry(self, index: int, entry_dict: Dict[str, Any]) -> None:
-        self.tmp_database.loc[index] = entry_dict
+        self.tmp_rows[index] = entry_dict
+
+    def modify_pending(self, column: str, value: Any) -> None:
+        for entry_dict in self.tmp_rows.values():
+            entry_dict[column] = value
 
     def find_entries(self, **kwargs: Mapping[str, Any]) -> pd.DataFrame:
         return self.database[self._get_mask(**kwargs)]
 
+    def find_key(self, *key: Any) -> List[Any]:
+        return self.key_index.get(key, [])
+
     def modify(self, to_modify: Dict[str, Any], **kwargs: Mapping[str, Any]) -> None:
         column = list(to_modify.keys())[0]
         value = list(to_modify.values())[0]
         self.database.loc[self._get_mask(**kwargs), column] = value
+        if column in self.key_columns:
+            self.key_index = self._init_key_index()
 
     def save(self) -> None:
-        for index in self.tmp_database.index:
-            self.database.loc[index] = self.tmp_database.loc[index]
-        self.tmp_database.drop(self.tmp_database.index, inplace=True)
+        if self.tmp_rows:
+            new_rows = pd.DataFrame.from_records(
+                list(self.tmp_rows.values()),
+                index=list(self.tmp_rows.keys()),
+                columns=self.database.columns,
+            )
+            keep = self.database.loc[~self.database.index.isin(new_rows.index)]
+            self.database = pd.concat([keep, new_rows]).sort_index()
+            self.tmp_rows.clear()
+            self.key_index = self._init_key_index()
         self.database.to_pickle(self.database_path)
+        self.dirty = False
+
+    def mark_dirty(self) -> None:
+        self.dirty = True
+
+    def flush(self) -> None:
+        if self.dirty:
+            self.save()
+
+    def _init_key_index(self) -> Dict[Tuple[Any, ...], List[Any]]:
+        key_index: Dict[Tuple[Any, ...], List[Any]] = defaultdict(list)
+        columns = [self.database[column] for column in self.key_columns]
+        for index, *key in zip(self.database.index, *columns):
+            key_index[tuple(key)].append(index)
+        return dict(key_index)
 
-    def _get_mask(self, **kwargs: Mapping[str, Any]) -> pd.Series:
-        masks = [self.database[key] == value for key, value in kwargs.items()]
-        return np.logical_and.reduce(masks)
+    def _get_mask(self, **kwargs: Mapping[str, Any]) -> np.ndarray:
+        mask = np.ones(len(self.database), dtype=bool)
+        for key, value in kwargs.items():
+            np.logical_and(mask, self.database[key].to_numpy() == value, out=mask)
+        return mask
 
 
 if __name__ == "__main__":
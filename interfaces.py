@@ -1,12 +1,27 @@
 import os
 from abc import ABC, abstractmethod
-from typing import Callable, List, Mapping, Any, AnyStr, Iterable
+from typing import (
+    IO,
+    Any,
+    AnyStr,
+    Callable,
+    ClassVar,
+    Deque,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Mapping,
+)
 
 from pathlib import Path
 from context import ContextMD
 from pipeline import NextStep
 import subprocess
+import threading
 import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from logging import Logger
 
 # class ContextInterface(ABC):
@@ -16,6 +31,14 @@ from logging import Logger
 #     def do_step(self, step_name: str) -> None:
 #         self.STEPS_HISTORY.append(step_name)
 
+# shared by all shell steps that run commands in the background
+_SHELL_EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+
+def _drain(stream: IO[str], callback: Callable[[str], Any]) -> None:
+    for line in stream:
+        callback(line)
+
 
 def verbose_call(call_function: Callable) -> Callable:
     def wrapper(self, context: ContextMD, next_step: NextStep) -> None:
@@ -30,50 +53,97 @@ def verbose_call(call_function: Callable) -> Callable:
 
 class PipeStepInterface(ABC):
     error: bool = False
+    logger: ClassVar[Logger]
+    # steps that call next_step only as their last statement set this to True,
+    # see pipeline.tail_call
+    tail_call: bool = False
     step_name: List[str]
 
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        # one logger per step class, named after it
+        cls.logger = logging.getLogger(cls.__name__)
+
     @abstractmethod
     def __call__(self, context: ContextMD, next_step: NextStep) -> None: ...
 
 
 class ShellInterface(PipeStepInterface):
     cmd: List[str]
+    # lines of each stream kept for the CompletedProcess of _run_command
+    output_tail: int = 200
 
     @abstractmethod
     def gen_command(self, *agrs, **kwargs): ...
 
     def _run_command(self, cmd: List[str], **kwargs) -> subprocess.CompletedProcess:
-        process = subprocess.run(
+        stdout: Deque[str] = deque(maxlen=self.output_tail)
+        stderr: Deque[str] = deque(maxlen=self.output_tail)
+
+        def print_stdout(line: str) -> None:
+            print(line, end="")
+            stdout.append(line)
+
+        returncode = self._run_command_streaming(
+            cmd, print_stdout, stderr.append, **kwargs
+        )
+        process = subprocess.CompletedProcess(
+            " ".join(cmd), returncode, "".join(stdout), "".join(stderr)
+        )
+        if process.returncode != 0:
+            print("COMMAND:\t", process.args)
+            print(process.stderr)
+            self.error = True
+        return process
+
+    def _run_command_streaming(
+        self,
+        cmd: List[str],
+        on_stdout: Callable[[str], Any],
+        on_stderr: Callable[[str], Any],
+        **kwargs,
+    ) -> int:
+        with subprocess.Popen(
             " ".join(cmd),
             shell=True,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
+            text=True,
+            # tool output is not always valid text, a bad byte must not stop
+            # the step or the stderr reader
+            errors="replace",
+            bufsize=1,
             **kwargs,
-        )
-        print(process.stdout)
-        if self._error_code(process):
-            self.error = True
-        return process
-
-    def _error_code(self, process: subprocess.CompletedProcess) -> bool:
-        if process.returncode != 0:
-            print("COMMAND:\t", " ".join(process.args))
-            print(process.stderr)
-            return True
-        return False
+        ) as process:
+            # stderr is drained alongside stdout so neither pipe fills up
+            stderr_reader = threading.Thread(
+                target=_drain, args=(process.stderr, on_stderr)
+            )
+            stderr_reader.start()
+            _drain(process.stdout, on_stdout)
+            stderr_reader.join()
+            return process.wait()
+
+    def _run_command_async(self, cmd: List[str], **kwargs) -> Future:
+        return _SHELL_EXECUTOR.submit(self._run_command, cmd, **kwargs)
 
     def _make_executable(self, file: Path) -> None:
         os.chmod(file, 0o777)
 
 
 class TopologyReadInterface(PipeStepInterface):
-    gmx_ext: List[str] = [".gro", ".top", ".itp"]
-    amber_ext: List[str] = [".parm7", ".prmtop", ".inpcrd", ".rst7", ".restrt"]
+    gmx_ext: FrozenSet[str] = frozenset({".gro", ".top", ".itp"})
+    amber_ext: FrozenSet[str] = frozenset(
+        {".parm7", ".prmtop", ".inpcrd", ".rst7", ".restrt"}
+    )
+    software_ext: Dict[str, str] = {
+        **dict.fromkeys(amber_ext, "amber"),
+        **dict.fromkeys(gmx_ext, "gromacs"),
+    }
 
     def _check_extention(self, file: os.PathLike) -> str:
-        filename, extention = os.path.splitext(file)
-        if extention in self.amber_ext:
-            return "amber"
-        if extention in self.gmx_ext:
-            return "gromacs"
-        raise Exception(f"Wrong {extention} extention")
+        extention = Path(file).suffix
+        try:
+            return self.software_ext[extention]
+        except KeyError:
+            raise ValueError(f"Wrong {extention} extention") from None
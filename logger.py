@@ -1,37 +1,51 @@
 import logging
 import json
 from logging import Logger
-from typing import Dict, Any
+from typing import Any, Mapping
 
 
-def log_json(logger: Logger, message: str, kwargs: Dict[str, Any]) -> None:
-    def type_string(x: Any) -> str:
-        return str(type(x)).split("'")[1]
+_encode_json = json.JSONEncoder(separators=(",", ":")).encode
+
+
+class _LazyJSON:
+    # formatted only if a handler actually emits the record
+    def __init__(self, kwargs: Mapping[str, Any]) -> None:
+        self.kwargs = kwargs
+
+    def __str__(self) -> str:
+        return _encode_json(
+            {k: f"{v} : {type(v).__name__}" for k, v in self.kwargs.items()}
+        )
 
-    logger.debug(
-        message + ": %s",
-        json.dumps(
-            {k: f"{str(v)} : {type_string(v)}".format()
-             for k, v in kwargs.items()},
-            indent=4,
-        ),
-    )
 
+def log_json(logger: Logger, message: str, kwargs: Mapping[str, Any]) -> None:
+    # skip stringifying every value when the message would be dropped
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
 
-# set up logging to file - see previous section for more details
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s %(name)-12s %(levelname)-8s %(message)s",
-    datefmt="%m-%d %H:%M",
-    filename="myapp.log",
-    filemode="w",
-)
-# define a Handler which writes INFO messages or higher to the sys.stderr
-console = logging.StreamHandler()
-console.setLevel(logging.INFO)
-# set a format which is simpler for console use
-formatter = logging.Formatter("%(name)-12s: %(levelname)-8s %(message)s")
-# tell the handler to use this format
-console.setFormatter(formatter)
-# add the handler to the root logger
-logging.getLogger("").addHandler(console)
+    logger.debug(message + ": %s", _LazyJSON(kwargs))
+
+
+def configure_logging(logfile: str = "myapp.log", level: int = logging.DEBUG) -> None:
+    # called once by the entry point, importing this module has no side effects
+    if getattr(configure_logging, "_done", False):
+        return
+    configure_logging._done = True
+
+    # set up logging to file - see previous section for more details
+    logging.basicConfig(
+        level=level,
+        format="%(asctime)s %(name)-12s %(levelname)-8s %(message)s",
+        datefmt="%m-%d %H:%M",
+        filename=logfile,
+        filemode="w",
+    )
+    # define a Handler which writes INFO messages or higher to the sys.stderr
+    console = logging.StreamHandler()
+    console.setLevel(logging.INFO)
+    # set a format which is simpler for console use
+    formatter = logging.Formatter("%(name)-12s: %(levelname)-8s %(message)s")
+    # tell the handler to use this format
+    console.setFormatter(formatter)
+    # add the handler to the root logger
+    logging.getLogger("").addHandler(console)
@@ -1,13 +1,14 @@
+import os
 import time
 from pathlib import Path
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, List, Set
 
 import context
 import pipeline as pip
 import logging
 import logger
 from interfaces import NextStep, PipeStepInterface
-from shell_commands import CheckProgerss, RunMD, RunSLURM
+from shell_commands import CheckProgerss, RunMD, RunSLURM, WriteRunFile
 from topology import (
     PrepareMDP,
     ReadBox,
@@ -17,12 +18,17 @@ from topology import (
     WritePositions,
 )
 
+_LOG_SUFFIXES = frozenset({".log", ".mdout"})
+# shortest time between two queue checks in watch_queue_routine
+_MIN_CHECK_SECONDS = 5 * 60
+
 
 def init_file_check_routine(
     context: context.ContextMD, next_step: NextStep
 ) -> None: ...
 
 
+@pip.tail_call
 def context_setup_routine(context: context.ContextMD, next_step: NextStep) -> None:
     log1 = logging.getLogger(__name__)
     log1.info("### STARTING CONTEXT SETUP ROUTINE ###")
@@ -59,51 +65,56 @@ def context_setup_routine(context: context.ContextMD, next_step: NextStep) -> No
     jobs.extend([job3, job4])
 
     # RUNNING PIPELINE #
-    pipe: pip.Pipeline = pip.Pipeline(*jobs)
+    pipe: pip.Pipeline = pip.Pipeline()
+    pipe.extend(jobs)
     pipe(context)
 
     next_step(context)
 
 
+@pip.tail_call
 def run_routine(context: context.ContextMD, next_step: NextStep) -> None:
     print("### STARTING RUN ROUTINE ###")
 
     runMD_configs: List[Dict[str, Any]] = context.RUNMD_CONFIG
     jobs: List[Callable] = []
 
+    # a single RUNMD section is repeated nruns times
     if len(runMD_configs) == 1:
         single_config = runMD_configs[0]
-        if context.TITLE_SOFTWARE == "gromacs":
-            prepare_mdp = PrepareMDP(single_config["file"])
-            jobs.append(prepare_mdp)
-
-        for i in range(single_config["nruns"]):
-            single_config["number"] = i
-            run = RunMD(**single_config)
-            run.gen_command()
-            jobs.append(run)
-
-    else:
-        for single_config in runMD_configs:
-            if context.TITLE_SOFTWARE == "gromacs":
+        runMD_configs = [
+            dict(single_config, number=i) for i in range(single_config["nruns"])
+        ]
+
+    is_gromacs = context.TITLE_SOFTWARE == "gromacs"
+    prepared_mdp: Set[Path] = set()
+    for single_config in runMD_configs:
+        if is_gromacs:
+            mdp_file = Path(single_config["file"]).resolve()
+            if mdp_file not in prepared_mdp:
+                prepared_mdp.add(mdp_file)
                 prepare_mdp = PrepareMDP(single_config["file"])
                 jobs.append(prepare_mdp)
 
-            run = RunMD(**single_config)
-            run.gen_command()
-            jobs.append(run)
+        run = RunMD(**single_config)
+        run.gen_command()
+        jobs.append(run)
 
     slurm_config = context.SLURM_CONFIG
     job9 = RunSLURM(**slurm_config)
     job9.gen_command()
 
     # RUNNING PIPELINE #
-    pipe: pip.Pipeline = pip.Pipeline(*jobs, job9)
+    pipe: pip.Pipeline = pip.Pipeline()
+    pipe.extend(jobs)
+    pipe.append(WriteRunFile())
+    pipe.append(job9)
     pipe(context)
 
     next_step(context)
 
 
+@pip.tail_call
 def rerun_routine(context: context.ContextMD, next_step: NextStep) -> None:
     print("### STARTING RERUN ROUTINE ###")
 
@@ -113,13 +124,23 @@ def rerun_routine(context: context.ContextMD, next_step: NextStep) -> None:
     data_dir = context.PATHS_DATA_DIR
     software = context.TITLE_SOFTWARE
 
+    run_columns = [
+        "SIMULATION NAME",
+        "POSITIONS FILE",
+        "TOPOLOGY FILE",
+        "CONFIG FILE",
+    ]
+
+    prepared_mdp: Set[Path] = set()
     pipe_jobs: List[Callable] = []
-    for index, run in runs.iterrows():
-        sim_name = run.loc["SIMULATION NAME"]
-        positions_file = data_dir / run.loc["POSITIONS FILE"]
-        topology_file = data_dir / run.loc["TOPOLOGY FILE"]
-        config_file = data_dir / run.loc["CONFIG FILE"]
-        if software == "gromacs":
+    for sim_name, positions_name, topology_name, config_name in runs[
+        run_columns
+    ].itertuples(index=False, name=None):
+        positions_file = data_dir / positions_name
+        topology_file = data_dir / topology_name
+        config_file = data_dir / config_name
+        if software == "gromacs" and config_file.resolve() not in prepared_mdp:
+            prepared_mdp.add(config_file.resolve())
             prepare_mdp = PrepareMDP(config_file)
             pipe_jobs.append(prepare_mdp)
         number, sim_type = sim_name.split("-")
@@ -142,37 +163,39 @@ def rerun_routine(context: context.ContextMD, next_step: NextStep) -> None:
     job9.gen_command()
 
     # RUNNING PIPELINE #
-    pipe: pip.Pipeline = pip.Pipeline(*pipe_jobs, job9)
+    pipe: pip.Pipeline = pip.Pipeline()
+    pipe.extend(pipe_jobs)
+    pipe.append(WriteRunFile())
+    pipe.append(job9)
     pipe(context)
 
     next_step(context)
 
 
+@pip.tail_call
 def check_runs_routine(context: context.ContextMD, next_step: NextStep) -> None:
-    def filter_logs(file_name: Path) -> bool:
-        ext = file_name.suffix
-        if ext in [".log", ".mdout"]:
-            return True
-        return False
-
     print("### STARTING CHECK RUNS ROUTINE ###")
 
-    log_list = filter(filter_logs, list(context.PATHS_DATA_DIR.iterdir()))
-
-    pipe_jobs = []
-    for log_file in list(log_list):
-        log_file = context.PATHS_DATA_DIR / log_file
-        print(log_file)
-        pipe_jobs.append(CheckProgerss(log_file))
+    # CheckProgerss logs every file it is given
+    with os.scandir(context.PATHS_DATA_DIR) as entries:
+        pipe_jobs = [
+            CheckProgerss(Path(entry.path))
+            for entry in entries
+            if os.path.splitext(entry.name)[1] in _LOG_SUFFIXES
+            and entry.is_file()
+        ]
 
-    pipe: pip.Pipeline = pip.Pipeline(*pipe_jobs)
+    pipe: pip.Pipeline = pip.Pipeline()
+    pipe.extend(pipe_jobs)
     pipe(context)
+    context.DATABASE.flush()
 
     print(context.DATABASE.database[columns])
 
     next_step(context)
 
 
+@pip.tail_call
 def watch_queue_routine(context: context.ContextMD, next_step: NextStep) -> None:
     if not hasattr(context, "PID"):
         context.PID = context.DATABASE.find_entries(
@@ -202,12 +225,26 @@ def watch_queue_routine(context: context.ContextMD, next_step: NextStep) -> None
         new_time_struct = time.localtime(new_time_seconds)
         new_time_str = time.strftime("%Y-%m-%d %H:%M:%S", new_time_struct)
 
-        print("Next check: ", new_time_str)
-        time.sleep(900)
+        print("Next check at the latest: ", new_time_str)
+
+        # wake up as soon as a file is written in the remote directory
+        waited = context.SSH_CONNECTION.run_remotely(
+            f"inotifywait -qq -e close_write -t 900 {context.PATHS_REMOTE_DIR}"
+        )
+        if waited.returncode not in (0, 2):
+            # inotifywait is not available remotely, fall back to polling
+            time.sleep(max(0, new_time_seconds - time.time()))
+        else:
+            # pmemd rewrites its .info file every ntpr steps, so keep a floor
+            # between checks instead of polling the login node on every write
+            time.sleep(
+                max(0, current_time_seconds + _MIN_CHECK_SECONDS - time.time())
+            )
 
     next_step(context)
 
 
+@pip.tail_call
 def remote_run_routine(context: context.ContextMD, next_step: NextStep) -> None:
     print("### STARTING REMOTE RUN PROCEDURE ###")
 
@@ -229,39 +266,40 @@ def remote_run_routine(context: context.ContextMD, next_step: NextStep) -> None:
     next_step(context)
 
 
+@pip.tail_call
 def download_logs(context: context.ContextMD, next_step: NextStep) -> None:
-    context.SSH_CONNECTION.send_files(
-        f"{context.PATHS_REMOTE_ADRESS}:{context.PATHS_REMOTE_DIR}/" + "*.{log,mdout}",
+    context.SSH_CONNECTION.sync_files(
+        f"{context.PATHS_REMOTE_ADRESS}:{context.PATHS_REMOTE_DIR}/",
         f"{context.PATHS_DATA_DIR}/",
+        include=["*.log", "*.mdout"],
     )
     next_step(context)
 
 
+@pip.tail_call
 def download_finished(context: context.ContextMD, next_step: NextStep) -> None:
     runs = context.DATABASE.find_entries(
         **{"PROJECT NAME": context.TITLE_PROJECT_NAME})
-    sim_names: List[str] = []
+    finished = runs["STAGE"].to_numpy() == "Finished"
+    sim_names: List[str] = runs.loc[finished, "SIMULATION NAME"].tolist()
 
-    for _, run in runs.iterrows():
-        if run["STAGE"] == "Finished":
-            sim_names.append(run["SIMULATION NAME"])
+    if not sim_names:
+        next_step(context)
+        return
 
-    files = "{%s}.*" % (",".join(sim_names))
-
-    context.SSH_CONNECTION.send_files(
-        f"{context.PATHS_REMOTE_ADRESS}:{context.PATHS_REMOTE_DIR}/" + files,
+    # rsync only removes the remote copies that were transferred
+    context.SSH_CONNECTION.sync_files(
+        f"{context.PATHS_REMOTE_ADRESS}:{context.PATHS_REMOTE_DIR}/",
         f"{context.PATHS_DATA_DIR}/",
+        include=[f"{sim_name}.*" for sim_name in sim_names],
+        remove_source=True,
     )
 
-    context.SSH_CONNECTION.run_remotely(
-        f"rm {context.PATHS_REMOTE_DIR}/{files}")
-
     next_step(context)
 
 
 if __name__ == "__main__":
-    # logger()
-    import os
+    logger.configure_logging()
     import re
 
     root = "/home/keppen/MD/parameters/amber-gpu-test-config"
@@ -299,3 +337,4 @@ if __name__ == "__main__":
 
         test_context.DATABASE.save()
         print(test_context.DATABASE.database[columns])
+        test_context.SSH_CONNECTION.close()
@@ -1,9 +1,37 @@
-from typing import TypeVar, Protocol, Callable, Generic, runtime_checkable, Any, List
+import asyncio
+import inspect
+import threading
+from typing import (
+    TypeVar,
+    Protocol,
+    Callable,
+    Generic,
+    runtime_checkable,
+    Any,
+    Iterable,
+    List,
+    Optional,
+)
 
 Context = TypeVar("Context", contravariant=True)
 NextStep = Callable[[Any], None]
 
 
+def tail_call(step: Callable) -> Callable:
+    # marks a step whose only next_step call is its last statement
+    step.tail_call = True
+    return step
+
+
+class _TailStep:
+    # handed to tail_call steps, records the call instead of recursing
+    def __init__(self) -> None:
+        self.called = False
+
+    def __call__(self, context: Any) -> None:
+        self.called = True
+
+
 @runtime_checkable
 class PipeStep(Protocol[Context]):
     def __call__(self, context: Context, next_step: NextStep) -> None: ...
@@ -11,11 +39,14 @@ class PipeStep(Protocol[Context]):
 
 class Pipeline(Generic[Context]):
     def __init__(self, *steps: PipeStep) -> None:
-        self.queue = [step for step in steps]
+        self.queue = list(steps)
 
     def append(self, step):
         self.queue.append(step)
 
+    def extend(self, steps: Iterable[PipeStep]):
+        self.queue.extend(steps)
+
     def __call__(self, context: Context):
         execute: PipeCursor = PipeCursor(self.queue)
 
@@ -23,16 +54,97 @@ class Pipeline(Generic[Context]):
 
 
 class PipeCursor(Generic[Context]):
-    def __init__(self, steps: List[PipeStep]):
+    def __init__(self, steps: List[PipeStep], index: int = 0):
         self.queue = steps
+        self.index = index
 
     def __call__(self, context: Context) -> None:
-        if not self.queue:
+        # tail_call steps run one after another in this loop, any other step
+        # gets the rest of the queue as next_step and runs it recursively
+        queue = self.queue
+        index = self.index
+        while index < len(queue):
+            current_step = queue[index]
+            index += 1
+            if not getattr(current_step, "tail_call", False):
+                current_step(context, PipeCursor(queue, index))
+                return None
+
+            next_step = _TailStep()
+            current_step(context, next_step)
+            if not next_step.called:
+                return None
+        return None
+
+
+def _is_async(step: Any) -> bool:
+    return inspect.iscoroutinefunction(step) or inspect.iscoroutinefunction(
+        getattr(type(step), "__call__", None)
+    )
+
+
+class AsyncPipeline(Pipeline[Context]):
+    # async steps await next_step, sync steps run in a worker thread so the
+    # event loop can serve other pipelines while they block
+    async def __call__(self, context: Context) -> None:
+        execute: AsyncPipeCursor = AsyncPipeCursor(self.queue)
+
+        return await execute(context)
+
+
+class AsyncPipeCursor(Generic[Context]):
+    def __init__(self, steps: List[Any], index: int = 0):
+        self.queue = steps
+        self.index = index
+
+    async def __call__(self, context: Context) -> None:
+        queue = self.queue
+        index = self.index
+        while index < len(queue):
+            current_step = queue[index]
+            index += 1
+            if _is_async(current_step):
+                await current_step(context, AsyncPipeCursor(queue, index))
+                return None
+
+            if getattr(current_step, "tail_call", False):
+                tail_step = _TailStep()
+                await asyncio.to_thread(current_step, context, tail_step)
+                if not tail_step.called:
+                    return None
+                continue
+
+            # the step may wrap next_step and blocks until the rest of the queue
+            # is done on this event loop, so it gets its own thread instead of
+            # holding a worker of the shared executor
+            loop = asyncio.get_running_loop()
+            rest: AsyncPipeCursor = AsyncPipeCursor(queue, index)
+            done: asyncio.Future = loop.create_future()
+
+            def next_step(context: Context) -> None:
+                asyncio.run_coroutine_threadsafe(rest(context), loop).result()
+
+            def run_step() -> None:
+                try:
+                    current_step(context, next_step)
+                except BaseException as error:
+                    loop.call_soon_threadsafe(_resolve, done, error)
+                else:
+                    loop.call_soon_threadsafe(_resolve, done, None)
+
+            threading.Thread(target=run_step, daemon=True).start()
+            await done
             return None
-        current_step = self.queue[0]
-        next_step: PipeCursor = PipeCursor(self.queue[1:])
+        return None
+
 
-        current_step(context, next_step)
+def _resolve(future: asyncio.Future, error: Optional[BaseException]) -> None:
+    if future.cancelled():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
 
 
 if __name__ == "__main__":
@@ -1,23 +1,54 @@
 import os
 import re
+import copy
+import mmap
 import parmed as pmd
-import logging
 
+from functools import cached_property, lru_cache
 from pathlib import Path
-from typing import Any, Mapping, Dict, Optional
+from typing import Any, Mapping, Dict, List, Optional, Tuple
 from context import ContextMD
 from interfaces import ShellInterface, PipeStepInterface, verbose_call
 from pipeline import NextStep
 
+_DIGIT_RE = re.compile(r"\d+")
+
+
+@lru_cache(maxsize=256)
+def _find_log_line(
+    log_file: str, size: int, mtime_ns: int, option: str, last: bool
+) -> Optional[str]:
+    # size and mtime_ns only key the cache, a log that grew is scanned again
+    if size == 0:
+        return None
+    with open(log_file, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            keyword = option.encode()
+            index = log.rfind(keyword) if last else log.find(keyword)
+            if index == -1:
+                return None
+            start = log.rfind(b"\n", 0, index) + 1
+            end = log.find(b"\n", index)
+            if end == -1:
+                end = len(log)
+            return log[start:end].decode()
+
+
+@lru_cache(maxsize=16)
+def _load_structure(file: str, size: int, mtime_ns: int) -> pmd.Structure:
+    return pmd.load_file(file)
+
 
 class ObabelShell(ShellInterface):
+    tail_call = True
+
     def __init__(self, molecule_name: str) -> None:
         self.molecule_name = molecule_name
         self.step_name = ["OBABELRUN", self.molecule_name]
 
     @verbose_call
     def __call__(self, context: ContextMD, next_step: NextStep) -> None:
-        self.cmd[-1] = os.path.join(context.DATA_DIR, self.cmd[-1])
+        self.cmd[-1] = os.path.join(context.PATHS_DATA_DIR, self.cmd[-1])
         self._run_command(self.cmd)
         next_step(context)
 
@@ -35,33 +66,118 @@ class ObabelShell(ShellInterface):
             self.cmd.insert(2, "--gen3d")
 
 
+class ObabelBatchShell(ShellInterface):
+    tail_call = True
+
+    def __init__(self, molecule_names: List[str]) -> None:
+        self.shells = [ObabelShell(name) for name in molecule_names]
+        self.step_name = ["OBABELRUN", *molecule_names]
+
+    @verbose_call
+    def __call__(self, context: ContextMD, next_step: NextStep) -> None:
+        for shell in self.shells:
+            shell.cmd[-1] = os.path.join(context.PATHS_DATA_DIR, shell.cmd[-1])
+
+        # obabel runs outside the GIL, so the conversions overlap
+        futures = [shell._run_command_async(shell.cmd) for shell in self.shells]
+        for future in futures:
+            future.result()
+        self.error = any(shell.error for shell in self.shells)
+        next_step(context)
+
+    def gen_command(self, files: List[str], in_format: str, out_format: str):
+        if len(files) != len(self.shells):
+            raise ValueError(
+                f"Got {len(files)} files for {len(self.shells)} molecules"
+            )
+        for shell, file in zip(self.shells, files):
+            shell.gen_command(file, in_format, out_format)
+
+
 class ModifyChemFile(PipeStepInterface):
+    tail_call = True
+
+    # residue columns are fixed in these formats, so they can be edited as text
+    text_ext = frozenset({".pdb", ".gro"})
+    # pdb records that carry resname, chain and residue number
+    pdb_residue_records = ("ATOM  ", "HETATM", "ANISOU", "TER")
+
     def __init__(self, molecule_name: str, file: str) -> None:
         self.molecule_name = molecule_name
-        self.structure = self._init_structure(file)
+        self.file = file
+        _, self.file_ext = os.path.splitext(os.path.basename(file))
+        self.lines: Optional[List[str]] = None
         self.step_name = ["MODIFY"]
 
     @verbose_call
     def __call__(self, context: ContextMD, next_step: NextStep) -> None:
         file = context.PATHS_DATA_DIR / (self.molecule_name + self.file_ext)
-        self.structure.save(file, overwrite=True)
+        if self.lines is not None:
+            with open(file, "w") as chem_file:
+                chem_file.writelines(self.lines)
+        else:
+            self.structure.save(file, overwrite=True)
         next_step(context)
 
+    @cached_property
+    def structure(self) -> pmd.Structure:
+        return self._init_structure(self.file)
+
     def _init_structure(self, file: str) -> pmd.Structure:
-        _, self.file_ext = os.path.basename(file).split(".")
-        return pmd.load_file(file)
+        stat = os.stat(file)
+        # the structure gets modified, never hand out the cached instance
+        return copy.copy(_load_structure(str(file), stat.st_size, stat.st_mtime_ns))
 
     def modify_resname(self, resname: str) -> None:
         self.step_name.extend(["RESNAME", resname])
+        # the structure is what gets saved from now on, drop any text edit
+        self.lines = None
+        residues = self.structure.residues
+        if len(residues) == 1 and residues[0].name == resname:
+            return
+
         new_residue = pmd.Residue(resname, chain="A", number=1)
-        for atom in self.structure:
-            new_residue.add_atom(atom)
+        atoms = self.structure.atoms
+        new_residue.atoms = list(atoms)
+        for atom in atoms:
+            atom.residue = new_residue
 
         reslist = pmd.ResidueList([new_residue])
         self.structure.residues = reslist
 
+    def modify_resname_fast(self, resname: str) -> None:
+        # other formats, or a structure parmed already holds, take the slow path
+        if self.file_ext not in self.text_ext or "structure" in self.__dict__:
+            self.modify_resname(resname)
+            return
+
+        self.step_name.extend(["RESNAME", resname])
+        if self.lines is None:
+            with open(self.file, "r") as chem_file:
+                self.lines = chem_file.readlines()
+        lines = self.lines
+
+        if self.file_ext == ".pdb":
+            # resname, chain and residue number, columns 18-26
+            residue = f"{resname:<4.4}A{1:>4}"
+            for i, line in enumerate(lines):
+                if line.startswith(self.pdb_residue_records):
+                    body = line.rstrip("\r\n")
+                    ending = line[len(body):]
+                    # short records such as a bare "TER" are padded first
+                    body = body.ljust(26)
+                    lines[i] = body[:17] + residue + body[26:] + ending
+        else:
+            # residue number and resname, columns 1-10 of every atom line
+            residue = f"{1:>5}{resname:<5.5}"
+            natoms = int(lines[1])
+            for i in range(2, 2 + natoms):
+                lines[i] = residue + lines[i][10:]
+
 
 class RunMD(ShellInterface):
+    tail_call = True
+
     sim_type: str
     software: str
     number: int
@@ -70,9 +186,50 @@ class RunMD(ShellInterface):
     topology_file: Path
     positions_file: Path
 
-    def __init__(self, **kwargs: Any):
-        self.logger = logging.getLogger(self.__class__.__name__)
+    amber_template = (
+        "",
+        "-O",
+        "-i",
+        "{file}",  # input md options, 3
+        "-p",
+        "{topology}",  # parameter file, 5, .parm7
+        "-c",
+        "{positions}",  # coordinate file , 7, .rst7
+        "-r",
+        "{job_name}.rst7",
+        "-x",
+        "{job_name}.nc",
+        "-v",
+        "{job_name}.vel",
+        "-e",
+        "{job_name}.ene",
+        "-inf",
+        "{job_name}.info",
+        "-l",
+        "{job_name}.mdlog",
+        "-o",
+        "{job_name}.mdout",
+        "\n",
+    )
+    gromacs_template = (
+        "gmx",
+        "grompp",
+        "-f",
+        "{file}",
+        "-p",
+        "{topology}",  # parameter file, 5, .top
+        "-c",
+        "{positions}",  # coordinate file, 7, .gro
+        "-o",
+        "{job_name}.tpr",
+        "\n\n",
+        "",
+        "mdrun",
+        "-deffnm",
+        "{job_name}",
+    )
 
+    def __init__(self, **kwargs: Any):
         self.__dict__.update(kwargs)
         self.job_name = f"{self.number}-{self.sim_type}"
         self.step_name = ["SIMULATION", self.sim_type]
@@ -80,8 +237,6 @@ class RunMD(ShellInterface):
         self.logger.info(f"Running simulation {str(self.job_name)}")
 
     def __call__(self, context: ContextMD, next_step: NextStep) -> None:
-        file_path = context.PATHS_DATA_DIR / "md.run"
-
         context.CURRENT_TOPFILE = self.topology_file
         context.CURRENT_POSFILE = self.positions_file
         context.CURRENT_CONFIGFILE = self.file
@@ -92,80 +247,64 @@ class RunMD(ShellInterface):
         self.logger.debug(f"Modified database: index {index}")
 
         if self.software == "gromacs":
-            if context.SLURM_RESOURCE == "cpu":
-                self.cmd[-4] = "gmx"
-                self.cmd.extend(
-                    ["-nt", str(context.SLURM_CPUS_PER_TASK), "\n"])
-            if context.SLURM_RESOURCE == "gpu":
+            if context.SLURM_RESOURCE in ("cpu", "gpu"):
+                nthreads = str(context.SLURM_CPUS_PER_TASK)
                 self.cmd[-4] = "gmx"
-                self.cmd.extend(
-                    ["-nt", str(context.SLURM_CPUS_PER_TASK), "\n"])
+                self.cmd.extend(["-nt", nthreads, "\n"])
         if self.software == "amber":
             if context.SLURM_RESOURCE == "cpu":
                 self.cmd[0] = f"mpirun -np {context.SLURM_NTASKS} pmemd.MPI"
             if context.SLURM_RESOURCE == "gpu":
                 self.cmd[0] = "pmemd.cuda.MPI"
 
-        with open(file_path, "a") as run_file:
-            msg = " ".join(self.cmd)
-            run_file.writelines(msg)
-        self._make_executable(file_path)
+        context.RUN_COMMANDS.append(" ".join(self.cmd))
 
-        self.logger.debug(f"Saved MDrun script {str(file_path)}")
+        self.logger.debug("Queued MDrun command")
         next_step(context)
 
     def gen_command(self) -> None:
         if self.software == "amber":
-            self.cmd = [
-                "",
-                "-O",
-                "-i",
-                self.file.name,  # input md options, 3
-                "-p",
-                self.topology_file.name,  # parameter file, 5, .parm7
-                "-c",
-                self.positions_file.name,  # coordinate file , 7, .rst7
-                "-r",
-                f"{self.job_name}.rst7",
-                "-x",
-                f"{self.job_name}.nc",
-                "-v",
-                f"{self.job_name}.vel",
-                "-e",
-                f"{self.job_name}.ene",
-                "-inf",
-                f"{self.job_name}.info",
-                "-l",
-                f"{self.job_name}.mdlog",
-                "-o",
-                f"{self.job_name}.mdout",
-                "\n",
-            ]
+            self.cmd = self._render_command(self.amber_template)
             self.step_name.extend(["AMBER", str(self.number)])
             self.logger.debug("Setting amber run")
         if self.software == "gromacs":
-            self.cmd = [
-                "gmx",
-                "grompp",
-                "-f",
-                self.file.name,
-                "-p",
-                self.topology_file.name,  # parameter file, 5, .top
-                "-c",
-                self.positions_file.name,  # coordinate file, 7, .gro
-                "-o",
-                f"{self.job_name}.tpr",
-                "\n\n",
-                "",
-                "mdrun",
-                "-deffnm",
-                f"{self.job_name}",
-            ]
+            self.cmd = self._render_command(self.gromacs_template)
             self.step_name.extend(["GROMACS", str(self.number)])
             self.logger.debug("Setting gromacs run")
 
+    def _render_command(self, template: Tuple[str, ...]) -> List[str]:
+        fields = {
+            "file": self.file.name,
+            "topology": self.topology_file.name,
+            "positions": self.positions_file.name,
+            "job_name": self.job_name,
+        }
+        # only placeholders need formatting, literal flags are reused as is
+        return [
+            token.format_map(fields) if "{" in token else token for token in template
+        ]
+
+
+class WriteRunFile(PipeStepInterface):
+    tail_call = True
+
+    def __init__(self) -> None:
+        self.step_name = ["WRITE_RUNFILE"]
+
+    def __call__(self, context: ContextMD, next_step: NextStep) -> None:
+        file_path = context.PATHS_DATA_DIR / "md.run"
+        with open(file_path, "a") as run_file:
+            run_file.write("".join(context.RUN_COMMANDS))
+        os.chmod(file_path, 0o777)
+        context.RUN_COMMANDS.clear()
+
+        self.logger.debug(f"Saved MDrun script {str(file_path)}")
+        next_step(context)
+
 
 class RunSLURM(ShellInterface):
+    tail_call = True
+
     nodes: int
     cpus_per_task: int
     ntasks: int
@@ -186,12 +325,15 @@ class RunSLURM(ShellInterface):
     gromacs_cpu = "module load GROMACS/2021-foss-2020b"
     amber_gpu = "module load Amber/22.0-foss-2021b-AmberTools-22.3-CUDA-11.4.1"
     amber_cpu = "module load Amber/22.0-foss-2021b-AmberTools-22.3-CUDA-11.4.1"
+    hardware_modules = {
+        ("gromacs", "gpu"): "gromacs_gpu",
+        ("gromacs", "cpu"): "gromacs_cpu",
+        ("amber", "gpu"): "amber_gpu",
+        ("amber", "cpu"): "amber_cpu",
+    }
 
     def __init__(self, **kwargs: Any) -> None:
-        self.logger = logging.getLogger(self.__class__.__name__)
-
-        for kwarg in kwargs:
-            self.__dict__.update(kwargs)
+        self.__dict__.update(kwargs)
         self.gpu_resources = f"gpu:{self.gpu_resources}:{self.ngpu}"
 
         self.logger.info("Constructing SLURM file")
@@ -201,7 +343,7 @@ class RunSLURM(ShellInterface):
         file_path = context.PATHS_DATA_DIR / "md.slurm"
         with open(file_path, "w") as run_file:
             msg = "\n".join(self.cmd)
-            run_file.writelines(msg)
+            run_file.write(msg)
         self._make_executable(file_path)
 
         self.logger.debug(f"Saved to {str(file_path)}")
@@ -226,16 +368,9 @@ class RunSLURM(ShellInterface):
         return slurm_script
 
     def _hardware_options(self) -> str:
-        if self.software == "gromacs":
-            if self.resource == "gpu":
-                return self.gromacs_gpu
-            if self.resource == "cpu":
-                return self.gromacs_cpu
-        if self.software == "amber":
-            if self.resource == "gpu":
-                return self.amber_gpu
-            if self.resource == "cpu":
-                return self.amber_cpu
+        module = self.hardware_modules.get((self.software, self.resource))
+        if module is not None:
+            return getattr(self, module)
         self.logger.debug(
             f"Hardware options: {self.software}, {self.resource}")
         return ""
@@ -249,11 +384,12 @@ class RunSLURM(ShellInterface):
 
 
 class CheckProgerss(PipeStepInterface):
+    tail_call = True
+
     def __init__(self, log_file: Path) -> None:
-        self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.info(f"Checking file {str(log_file)}")
 
-        self.log_content = self._read_log(log_file)
+        self.log_file = log_file
         self.job_name, self.extention = self._init_job_name(log_file)
         self.software = self._init_software()
         self.nsteps = self._init_nsteps()
@@ -268,8 +404,10 @@ class CheckProgerss(PipeStepInterface):
         if database_entry["STAGE"].tolist() == ["Finished"]:
             self.logger.info("Job has been finished already.")
             next_step(context)
+            return
 
-        done_steps = self.count_steps()
+        # a run without steps is complete without scanning its log
+        done_steps = self.count_steps() if self.nsteps else 0
         if self.nsteps == done_steps:
             stage_dict = {"STAGE": "Finished"}
             self.logger.info("Job has been finished.")
@@ -283,17 +421,19 @@ class CheckProgerss(PipeStepInterface):
             stage_dict,
             **job_kwargs,
         )
-        context.DATABASE.save()
-        self.logger.debug("Modified and save database")
+        context.DATABASE.mark_dirty()
+        self.logger.debug("Modified database")
         next_step(context)
 
     def _init_job_name(self, log_file: Path) -> tuple[Any, Any]:
         basename = os.path.basename(log_file)
         return os.path.splitext(basename)
 
-    def _read_log(self, log_file: Path):
-        with open(log_file, "r") as file:
-            return file.readlines()
+    def _find_line(self, option: str, last: bool = False) -> Optional[str]:
+        stat = os.stat(self.log_file)
+        return _find_log_line(
+            str(self.log_file), stat.st_size, stat.st_mtime_ns, option, last
+        )
 
     def _init_software(self) -> str:
         if self.extention == ".log":
@@ -308,11 +448,10 @@ class CheckProgerss(PipeStepInterface):
             option = "nsteps"
         if self.software == "amber":
             option = "nstlim"
-        for line in self.log_content:
-            if option in line:
-                nsteps = int(re.findall(r"\d+", line)[0])
-                break
-        return nsteps
+        line = self._find_line(option)
+        if line is None:
+            raise Exception(f"No {option} option in {str(self.log_file)}")
+        return int(_DIGIT_RE.search(line).group())
 
     def count_steps(self) -> int:
         if self.software == "gromacs":
@@ -320,11 +459,11 @@ class CheckProgerss(PipeStepInterface):
         if self.software == "amber":
             option = "NSTEP"
         steps_done = 0
-        for line in self.log_content:
-            if option in line:
-                steps_done = int(re.findall(r"\d+", line)[0])
-                if self.software == "gromacs":
-                    steps_done -= 1
+        line = self._find_line(option, last=True)
+        if line is not None:
+            steps_done = int(_DIGIT_RE.search(line).group())
+            if self.software == "gromacs":
+                steps_done -= 1
         return steps_done
 
 
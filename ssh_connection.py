@@ -1,13 +1,24 @@
 import os
 import subprocess
+import threading
 import logging
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator, List, Optional, Set, Tuple
 
 
 class SSHConnection:
+    # reuse one authenticated connection for every ssh/scp call to the host
+    ssh_options = [
+        "-o ControlMaster=auto",
+        "-o ControlPersist=60s",
+        "-o ControlPath=~/.ssh/cm-%r@%h:%p",
+    ]
+    # (address, SSH_AUTH_SOCK) pairs whose agent check already passed
+    checked_agents: Set[Tuple[str, Optional[str]]] = set()
+
+    logger = logging.getLogger(__name__)
+
     def __init__(self, ssh_adress: str, ssh_dir: Path):
-        self.logger = logging.getLogger(__name__)
         self.logger.info("Initializing SSH connection")
         self.ssh_adress = ssh_adress
         self.ssh_dir = ssh_dir
@@ -21,6 +32,11 @@ class SSHConnection:
         self._check_connection()
 
     def _check_connection(self):
+        agent_key = (self.ssh_adress, self.subprocess_kargs["env"]["SSH_AUTH_SOCK"])
+        if agent_key in self.checked_agents:
+            self.logger.info("Connection is OK")
+            return
+
         if self.subprocess_kargs["env"]["SSH_AUTH_SOCK"] is None:
             self.logger.error("ssh-agent is not set!")
             self.logger.error('run "eval `ssh-agent` && ssh-add"')
@@ -36,6 +52,7 @@ class SSHConnection:
             self.logger.error('Run "eval `ssh-agent` && ssh-add"')
         else:
             self.logger.info("Connection is OK")
+            self.checked_agents.add(agent_key)
             self.cmd = []
 
     def _run_command(self, **kargs) -> subprocess.CompletedProcess:
@@ -53,25 +70,88 @@ class SSHConnection:
             self.error = True
         return process
 
+    def _stream_command(self, cmd: List[str], **kargs) -> Iterator[str]:
+        self.logger.debug(f"COMMAND\t{' '.join(cmd)}")
+        with subprocess.Popen(
+            " ".join(cmd),
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=1,
+            **kargs,
+        ) as process:
+            # stderr is collected alongside stdout so neither pipe fills up
+            stderr: List[str] = []
+            stderr_reader = threading.Thread(
+                target=stderr.extend, args=(process.stderr,)
+            )
+            stderr_reader.start()
+            for line in process.stdout:
+                yield line.rstrip("\n")
+            stderr_reader.join()
+            process.wait()
+
+        if process.returncode != 0:
+            self.logger.debug(f"STDERR\t{''.join(stderr).strip()}")
+            self.error = True
+
     def _error_check(self, process: subprocess.CompletedProcess) -> bool:
         if process.returncode != 0:
             self.logger.debug(f"STDERR\t{process.stderr.strip()}")
             return True
         return False
 
-    def send_files(self, src: str, dest: str) -> None:
-        self.cmd = ["scp", src, dest]
-        self._run_command(**self.subprocess_kargs)
+    def send_files(self, src: str, dest: str) -> subprocess.CompletedProcess:
+        self.cmd = ["scp", *self.ssh_options, src, dest]
+        process = self._run_command(**self.subprocess_kargs)
         # if self.error:
         #     print("There was an error.")
+        return process
+
+    def sync_files(
+        self,
+        src: str,
+        dest: str,
+        include: List[str],
+        remove_source: bool = False,
+    ) -> subprocess.CompletedProcess:
+        filters = [f"--include='{pattern}'" for pattern in include]
+        self.cmd = ["rsync", "-az", *self._rsync_shell(), *filters, "--exclude='*'"]
+        if remove_source:
+            self.cmd.append("--remove-source-files")
+        self.cmd.extend([src, dest])
+        return self._run_command(**self.subprocess_kargs)
+
+    def send_files_batch(
+        self, files: List[str], src_dir: str, dest: str
+    ) -> subprocess.CompletedProcess:
+        # files are relative to src_dir and are all sent over one connection
+        self.cmd = ["rsync", "-az", *self._rsync_shell(), "--files-from=-"]
+        self.cmd.extend([src_dir, dest])
+        return self._run_command(input="\n".join(files), **self.subprocess_kargs)
+
+    def _rsync_shell(self) -> List[str]:
+        ssh = " ".join(["ssh", *self.ssh_options])
+        return ["-e", f'"{ssh}"']
 
     def run_remotely(self, command: str) -> subprocess.CompletedProcess:
-        self.cmd = ["ssh", self.ssh_adress, command]
+        self.cmd = ["ssh", *self.ssh_options, self.ssh_adress, command]
         process = self._run_command(**self.subprocess_kargs)
         # if self.error:
         #     print("There was an error.")
         return process
 
+    def stream_remotely(self, command: str) -> Iterator[str]:
+        # yields stdout lines while the remote command is still running, the
+        # command is fixed now since the generator only starts on iteration
+        cmd = ["ssh", *self.ssh_options, self.ssh_adress, command]
+        return self._stream_command(cmd, **self.subprocess_kargs)
+
+    def close(self) -> subprocess.CompletedProcess:
+        # stop the shared master instead of waiting for ControlPersist
+        self.cmd = ["ssh", *self.ssh_options, "-O", "exit", self.ssh_adress]
+        return self._run_command(**self.subprocess_kargs)
+
 
 # if __name__ == "__main__":
 # ssh = SSHConnection()._check_connection()
@@ -1,4 +1,3 @@
-import logging
 import os
 from pathlib import Path
 from typing import Any, Dict, List
@@ -18,9 +17,9 @@ from pipeline import NextStep
 
 
 class ReadTopology(TopologyReadInterface):
-    def __init__(self, name: str, file: Path, ff: str, times: int = 1) -> None:
-        self.logger = logging.getLogger(self.__class__.__name__)
+    tail_call = True
 
+    def __init__(self, name: str, file: Path, ff: str, times: int = 1) -> None:
         self.logger.info(f"Reading topology file {str(file)}")
 
         self.name = name
@@ -32,6 +31,7 @@ class ReadTopology(TopologyReadInterface):
     @verbose_call
     def __call__(self, context: ContextMD, next_step: NextStep) -> None:
         context.TOPOLOGIES[self.name] = self.structure
+        context.clear_cache("ENRG_GROUPS", "STRUCTURE")
 
         self.logger.debug("Structure loaded: " + str(self.structure))
         next_step(context)
@@ -54,8 +54,9 @@ class ReadTopology(TopologyReadInterface):
 
 
 class ReadPositions(TopologyReadInterface):
+    tail_call = True
+
     def __init__(self, file: Path) -> None:
-        self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.info(f"Reading positons file {str(file)}")
 
         self.positions_data = self.read_positions(file)
@@ -77,8 +78,9 @@ class ReadPositions(TopologyReadInterface):
 
 
 class ReadBox(TopologyReadInterface):
+    tail_call = True
+
     def __init__(self, file: Path) -> None:
-        self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.info(f"Reading positons file {str(file)}")
 
         self.box = self.read_box(file)
@@ -100,8 +102,9 @@ class ReadBox(TopologyReadInterface):
 
 
 class WriteParameters(TopologyReadInterface):
+    tail_call = True
+
     def __init__(self, basename: str, software: str) -> None:
-        self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.info("Writing paramters")
         self.software = software
         self.basename = basename
@@ -131,8 +134,9 @@ class WriteParameters(TopologyReadInterface):
 
 
 class WritePositions(TopologyReadInterface):
+    tail_call = True
+
     def __init__(self, basename: str, software: str) -> None:
-        self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.info("Writing positions")
 
         self.software = software
@@ -163,8 +167,9 @@ class WritePositions(TopologyReadInterface):
 
 
 class PrepareMDP(PipeStepInterface):
+    tail_call = True
+
     def __init__(self, file: Path) -> None:
-        self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.info(f"Setting up {str(file)}")
 
         self.file_name = file.name
@@ -202,7 +207,7 @@ class PrepareMDP(PipeStepInterface):
         file_path = context.PATHS_DATA_DIR / self.file_name
         with open(file_path, "w") as mdp_file:
             msg = "\n".join(self.to_list(self.mdp_dict))
-            mdp_file.writelines(msg)
+            mdp_file.write(msg)
 
         self.logger.debug(f"Saved to file {str(file_path)}")
         next_step(context)